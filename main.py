@@ -1,11 +1,25 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from pathlib import Path
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import os
 import unicodedata
 import io
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# python-calamine(Rust xlsx 파서)이 있으면 openpyxl 대신 사용
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
 
 # -----------------------------------------------------------------------------
 # 1. 페이지 설정 & CSS (한글 폰트 적용)
@@ -17,14 +31,20 @@ st.set_page_config(
 )
 
 # Streamlit UI 한글 폰트 적용
-st.markdown("""
+# CSS @import는 스타일시트를 받은 뒤에야 폰트 요청이 시작되어 첫 렌더를 막으므로
+# preconnect + <link>로 바로 요청하고, display=swap으로 폰트 로딩 중에도 기본 글꼴로 먼저 표시.
+# (Streamlit은 rerun 때 출력되지 않은 요소를 지우므로 매 실행마다 출력해야 함)
+FONT_CSS = """
+<link rel="preconnect" href="https://fonts.googleapis.com">
+<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+<link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Noto+Sans+KR:wght@300;400;700&display=swap">
 <style>
-@import url('https://fonts.googleapis.com/css2?family=Noto+Sans+KR:wght@300;400;700&display=swap');
 html, body, [class*="css"] {
     font-family: 'Noto Sans KR', 'Malgun Gothic', sans-serif;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(FONT_CSS, unsafe_allow_html=True)
 
 PLOTLY_FONT = dict(family="Noto Sans KR, Malgun Gothic, sans-serif")
 
@@ -38,31 +58,139 @@ SCHOOL_CONFIG = {
     "동산고": {"ec": 8.0, "color": "#d62728"},
 }
 
+# 렌더링마다 다시 만들지 않도록 모듈 로드 시 한 번만 계산
+SCHOOL_ORDER = list(SCHOOL_CONFIG.keys())
+SCHOOL_OPTIONS = ["전체"] + SCHOOL_ORDER  # 사이드바 선택지
+SCHOOL_CODES = {s: i for i, s in enumerate(SCHOOL_ORDER)}  # Categorical 코드
+COLOR_MAP = {k: v['color'] for k, v in SCHOOL_CONFIG.items()}
+EC_MAP = {k: np.float32(v['ec']) for k, v in SCHOOL_CONFIG.items()}
+SUMMARY_BASE = pd.DataFrame({"학교": SCHOOL_ORDER,
+                             "목표 EC": [SCHOOL_CONFIG[s]['ec'] for s in SCHOOL_ORDER]})
+
+# 학교는 4개 고정이므로 Categorical(int8 코드)로 저장 → groupby/필터가 문자열 해시 대신 코드 비교
+SCHOOL_DTYPE = pd.CategoricalDtype(categories=SCHOOL_ORDER, ordered=True)
+
+def school_column(school: str, n: int) -> pd.Categorical:
+    """학교명 n개짜리 Categorical을 문자열 리스트 없이 int8 코드 배열로 바로 생성"""
+    return pd.Categorical.from_codes(np.full(n, SCHOOL_CODES[school], dtype='int8'), dtype=SCHOOL_DTYPE)
+
+ENV_NUMERIC = ['temperature', 'humidity', 'ph', 'ec']  # 센서 측정값 (float32로 저장)
+ENV_DTYPES = {c: 'float32' for c in ENV_NUMERIC}
+GROWTH_COLS = ['생중량(g)', '잎 수(장)', '지상부 길이(mm)']  # 생육 측정값 (float32로 저장)
+MAX_POINTS = 2000  # 시계열 trace당 브라우저로 보내는 최대 포인트 수
+
 def normalize_str(s: str) -> str:
     """NFC 정규화 (맥/윈도우 자소 분리 해결)"""
     return unicodedata.normalize('NFC', s) if s else ""
 
+@functools.lru_cache(maxsize=1)
+def index_dir(base_dir: Path) -> dict:
+    """
+    폴더를 os.scandir 한 번으로 훑어 {NFC 정규화 파일명: Path} 사전을 만듦.
+    (학교/엑셀 파일마다 디렉터리를 다시 읽지 않도록 캐시)
+    """
+    if not base_dir.exists():
+        return {}
+    with os.scandir(base_dir) as it:
+        return {normalize_str(e.name): Path(e.path) for e in it
+                if e.is_file() and not e.name.startswith('~$')}  # 임시 파일 제외
+
 def find_file_fuzzy(base_dir: Path, keyword: str, extension: str) -> Path:
     """
     파일명에 'keyword'(예: 송도고)와 'extension'(예: .csv)이 
     모두 포함된 파일을 찾아서 반환. (이중 확장자 .csv.csv 해결용)
     """
-    if not base_dir.exists():
-        return None
-    
     keyword_norm = normalize_str(keyword)
-    
-    for p in base_dir.iterdir():
-        if p.is_file() and not p.name.startswith('~$'): # 임시 파일 제외
-            p_name_norm = normalize_str(p.name)
-            # 파일명에 키워드(학교명)가 있고, 확장자(.csv 등)도 포함되어 있으면 선택
-            if keyword_norm in p_name_norm and extension in p_name_norm:
-                return p
-    return None
+    # 파일명에 키워드(학교명)가 있고, 확장자(.csv 등)도 포함되어 있으면 선택
+    return next((p for name, p in index_dir(base_dir).items()
+                 if keyword_norm in name and extension in name), None)
+
+# 파싱/dtype 로직을 바꾸면 CACHE_VERSION을 올려서 예전 캐시를 무시하게 함
+CACHE_VERSION = 2
+ENV_CACHE_NAME = f"_env.v{CACHE_VERSION}.parquet"
+GROWTH_CACHE_NAME = f"_growth.v{CACHE_VERSION}.parquet"
+CACHE_META_KEY = b"dashboard_cache"
+
+# 캐시에서 읽은 데이터가 현재 코드가 만드는 dtype과 같은지 확인용
+ENV_CACHE_DTYPES = {'time': 'datetime64', 'school': SCHOOL_DTYPE, 'target_ec': 'float32',
+                    **{c: 'float32' for c in ENV_NUMERIC}}
+GROWTH_CACHE_DTYPES = {'school': SCHOOL_DTYPE, 'target_ec': 'float32'}
+
+def cache_stamp(sources) -> str:
+    """캐시 버전 + 원본 파일 목록/수정 시각 (하나라도 다르면 캐시 무효)"""
+    files = sorted((p.name, p.stat().st_mtime_ns) for p in sources)
+    return json.dumps({"version": CACHE_VERSION, "sources": files}, ensure_ascii=False)
+
+def has_expected_dtypes(df: pd.DataFrame, expected: dict) -> bool:
+    """expected의 컬럼이 모두 있고 dtype이 일치하는지 ('datetime64'는 종류만 확인)"""
+    for col, dtype in expected.items():
+        if col not in df.columns:
+            return False
+        if dtype == 'datetime64':
+            if not pd.api.types.is_datetime64_dtype(df[col]):
+                return False
+        elif df[col].dtype != dtype:
+            return False
+    return True
+
+def read_parquet_cache(cache: Path, sources, expected: dict) -> pd.DataFrame:
+    """
+    캐시를 만들 때의 버전/원본 파일 목록/수정 시각이 지금과 같고 dtype도 맞으면
+    parquet 캐시를 읽어서 반환, 아니면 None (원본을 다시 파싱).
+    (openpyxl XML 파싱 / CSV 파싱을 콜드 스타트마다 반복하지 않기 위함)
+    """
+    sources = list(sources)
+    if not sources or not cache.exists():
+        return None
+    try:
+        meta = pq.read_schema(cache).metadata or {}
+        if meta.get(CACHE_META_KEY, b"").decode() != cache_stamp(sources):
+            return None
+        df = pd.read_parquet(cache, engine='pyarrow')
+    except Exception:
+        return None
+    return df if has_expected_dtypes(df, expected) else None
+
+def write_parquet_cache(df: pd.DataFrame, cache: Path, sources):
+    """parquet 캐시 저장 (원본 정보는 메타데이터로). 읽기 전용 배포 환경 등에서 실패하면 캐시 없이 진행"""
+    if df.empty:
+        return
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[CACHE_META_KEY] = cache_stamp(sources).encode()
+        pq.write_table(table.replace_schema_metadata(meta), cache)
+    except Exception:
+        pass
+
+def read_env_csv(school: str, file_path: Path) -> pd.DataFrame:
+    """학교 환경 CSV 한 개를 읽어 전처리. 필수 컬럼이 없으면 None"""
+    # Arrow 멀티스레드 CSV 리더 (C 엔진보다 빠르고 BOM/공백 처리 동일)
+    # 측정값은 처음부터 float32로 파싱해 float64 중간 배열을 만들지 않음
+    try:
+        df = pd.read_csv(file_path, engine='pyarrow', dtype=ENV_DTYPES)
+    except ValueError:  # 숫자가 아닌 값이 섞인 경우: 타입 지정 없이 읽고 아래에서 변환
+        df = pd.read_csv(file_path, engine='pyarrow')
+    df.columns = [c.strip().lower() for c in df.columns] # 컬럼 소문자 변환
+
+    # 필수 컬럼 체크
+    required = ['time'] + ENV_NUMERIC
+    if not all(c in df.columns for c in required):
+        return None
+
+    # float32: 메모리/전송량 절반, Plotly base64 typed array 대상 dtype
+    for c in ENV_NUMERIC:
+        df[c] = pd.to_numeric(df[c], errors='coerce', downcast='float')
+    # 학교마다 시간 형식이 달라(2025.5.30 0:00 / 2025-06-01 00:00:00 등) 파일 단위로 변환
+    df['time'] = pd.to_datetime(df['time'], errors='coerce', format='mixed')
+    df['school'] = school_column(school, len(df))
+    df['target_ec'] = EC_MAP[school]
+    return df
 
 @st.cache_data
 def load_data():
     data_dir = Path("data")
+    index_dir.cache_clear()  # 로드할 때마다 폴더는 한 번만 새로 스캔
     
     # 1. 폴더 존재 확인
     if not data_dir.exists():
@@ -71,47 +199,58 @@ def load_data():
         if Path("polar-plant-dashboard/data").exists():
             data_dir = Path("polar-plant-dashboard/data")
         else:
-            return None, None
+            return None, None, {}
 
     # --- CSV 데이터 로딩 ---
-    env_dfs = []
-    
-    # 학교별로 파일을 찾아서 로드
-    for school in SCHOOL_CONFIG.keys():
+    csv_paths = {}
+    for school in SCHOOL_ORDER:
         # "송도고" 가 들어있고 ".csv" 가 들어있는 파일 찾기 (csv.csv도 찾아짐)
         file_path = find_file_fuzzy(data_dir, school, ".csv")
-        
         if file_path:
+            csv_paths[school] = file_path
+        else:
+            st.warning(f"⚠️ '{school}' 관련 .csv 파일을 찾을 수 없습니다.")
+
+    env_cache = data_dir / ENV_CACHE_NAME
+    env_df_total = read_parquet_cache(env_cache, csv_paths.values(), ENV_CACHE_DTYPES)
+    if env_df_total is None:
+        env_dfs = []
+
+        # 학교별 CSV를 스레드 풀로 동시에 로드 (Arrow 파서는 GIL을 놓고 파싱)
+        # st.warning은 스크립트 스레드에서만 표시되므로 예외는 메인 스레드에서 처리
+        with ThreadPoolExecutor(max_workers=len(csv_paths) or 1) as ex:
+            futures = {school: ex.submit(read_env_csv, school, file_path)
+                       for school, file_path in csv_paths.items()}
+        for school, future in futures.items():
             try:
-                df = pd.read_csv(file_path)
-                df.columns = [c.strip().lower() for c in df.columns] # 컬럼 소문자 변환
-                
-                # 필수 컬럼 체크
-                required = ['time', 'temperature', 'humidity', 'ph', 'ec']
-                if all(c in df.columns for c in required):
-                    df['school'] = school
-                    df['target_ec'] = SCHOOL_CONFIG[school]['ec']
+                df = future.result()
+                if df is not None:
                     env_dfs.append(df)
             except Exception as e:
-                st.warning(f"⚠️ {school} 파일({file_path.name}) 로드 중 오류: {e}")
-        else:
-            st.warning(f"⚠️ '{school}' 관련 .csv 파일을 찾을 수 없습니다.")
+                st.warning(f"⚠️ {school} 파일({csv_paths[school].name}) 로드 중 오류: {e}")
 
-    env_df_total = pd.concat(env_dfs, ignore_index=True) if env_dfs else pd.DataFrame()
-    if not env_df_total.empty and 'time' in env_df_total.columns:
-        env_df_total['time'] = pd.to_datetime(env_df_total['time'], errors='coerce')
+        env_df_total = pd.concat(env_dfs, ignore_index=True) if env_dfs else pd.DataFrame()
+        # 모든 학교가 정상 로드됐을 때만 캐시 (일부 누락된 결과가 경고 없이 재사용되지 않도록)
+        if len(env_dfs) == len(SCHOOL_ORDER):
+            write_parquet_cache(env_df_total, env_cache, csv_paths.values())
 
     # --- Excel 데이터 로딩 ---
     growth_dfs = []
+    growth_df_total = None
     # "생육" 이라는 단어와 ".xlsx" 가 들어있는 파일 찾기 (xlsx.xlsx도 찾아짐)
     excel_path = find_file_fuzzy(data_dir, "생육", ".xlsx")
     
     if excel_path:
+        growth_cache = data_dir / GROWTH_CACHE_NAME
+        growth_df_total = read_parquet_cache(growth_cache, [excel_path], GROWTH_CACHE_DTYPES)
+    if excel_path and growth_df_total is None:
+        growth_complete = True
         try:
-            xls = pd.ExcelFile(excel_path)
-            sheet_map = {normalize_str(s): s for s in xls.sheet_names}
+            # 모든 시트를 한 번에 읽음 (워크북을 시트마다 다시 열지 않음)
+            sheets = pd.read_excel(excel_path, sheet_name=None, engine=EXCEL_ENGINE)
+            sheet_map = {normalize_str(s): s for s in sheets}
             
-            for school in SCHOOL_CONFIG.keys():
+            for school in SCHOOL_ORDER:
                 school_norm = normalize_str(school)
                 
                 # 시트 이름 매칭 확인
@@ -122,46 +261,265 @@ def load_data():
                         break
                 
                 if matched_sheet:
-                    df_g = pd.read_excel(xls, sheet_name=matched_sheet)
-                    df_g['school'] = school
-                    df_g['target_ec'] = SCHOOL_CONFIG[school]['ec']
+                    df_g = sheets[matched_sheet]
+                    for c in GROWTH_COLS:
+                        if c in df_g.columns:
+                            df_g[c] = pd.to_numeric(df_g[c], errors='coerce', downcast='float')
+                    df_g['school'] = school_column(school, len(df_g))
+                    df_g['target_ec'] = EC_MAP[school]
                     growth_dfs.append(df_g)
                 else:
                     st.warning(f"⚠️ 엑셀 파일 내 '{school}' 시트를 찾을 수 없습니다.")
+                    growth_complete = False
                     
         except Exception as e:
             st.warning(f"⚠️ 엑셀 파일({excel_path.name}) 로드 실패: {e}")
-    else:
+            growth_complete = False
+
+        growth_df_total = pd.concat(growth_dfs, ignore_index=True) if growth_dfs else pd.DataFrame()
+        # 시트가 하나라도 빠졌으면 캐시하지 않음 (다음 실행에서도 경고가 다시 표시되도록)
+        if growth_complete:
+            write_parquet_cache(growth_df_total, growth_cache, [excel_path])
+    elif not excel_path:
         st.warning("⚠️ '생육' 관련 .xlsx 파일을 찾을 수 없습니다.")
+        growth_df_total = pd.DataFrame()
+
+    # 학교별 시계열 조각을 시간순으로 미리 나눠 둠 (탭2에서 매번 groupby 하지 않도록)
+    env_by_school = {}
+    if not env_df_total.empty:
+        env_by_school = {s: g.sort_values('time').reset_index(drop=True)
+                         for s, g in env_df_total.groupby('school', sort=False, observed=True)}
 
-    growth_df_total = pd.concat(growth_dfs, ignore_index=True) if growth_dfs else pd.DataFrame()
+    return env_df_total, growth_df_total, env_by_school
 
-    return env_df_total, growth_df_total
+# 로드 이후 데이터프레임은 변하지 않으므로 모양/컬럼만으로 가볍게 해시
+_FRAME_HASH = {pd.DataFrame: lambda df: (df.shape, df.columns.tolist())}
+
+def group_means(codes: np.ndarray, arrays, n_groups: int):
+    """
+    정수 코드별 평균 (NaN 제외). pandas groupby 대신 np.bincount로 합/개수를 한 번에 계산.
+    반환: (그룹별 행 수, [그룹 x 컬럼] 평균 배열)
+    """
+    sizes = np.bincount(codes, minlength=n_groups)
+    means = []
+    for a in arrays:
+        a = np.asarray(a, dtype='float64')
+        valid = ~np.isnan(a)
+        sums = np.bincount(codes[valid], weights=a[valid], minlength=n_groups)
+        counts = np.bincount(codes[valid], minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means.append(sums / counts)
+    return sizes, np.stack(means, axis=1)
+
+def mean_by_school(df, cols):
+    """Categorical school 코드 기준 컬럼별 평균 + 개체수 (데이터가 있는 학교만)"""
+    codes = df['school'].cat.codes.to_numpy()
+    sizes, means = group_means(codes, [df[c].to_numpy() for c in cols], len(SCHOOL_ORDER))
+    summary = pd.DataFrame(means, columns=cols)
+    summary.insert(0, 'school', pd.Categorical(SCHOOL_ORDER, dtype=SCHOOL_DTYPE))
+    summary['개체수'] = sizes
+    return summary[sizes > 0].reset_index(drop=True)
+
+def compute_growth_summary(growth_df):
+    """학교(EC)별 평균 생육값 + 개체수"""
+    if growth_df.empty:
+        return pd.DataFrame()
+    cols = [c for c in GROWTH_COLS if c in growth_df.columns]
+    return mean_by_school(growth_df, ['target_ec'] + cols)
+
+def compute_kpis(env_df, growth_df):
+    """개요 탭 KPI (생육 데이터 개수, 환경 데이터 마지막 측정 시각)"""
+    kpis = {"growth_count": len(growth_df)}
+    if not env_df.empty:
+        kpis["last_update"] = env_df['time'].max()
+    return kpis
+
+@st.cache_data(hash_funcs=_FRAME_HASH)
+def compute_summaries(env_df, growth_df):
+    """
+    탭에서 쓰는 모든 집계를 한 번에 계산해 캐시 (rerun마다 groupby 재계산 방지).
+    반환: growth_avg / counts / kpis
+    """
+    counts = pd.Series(0, index=SCHOOL_ORDER)
+    if not growth_df.empty:
+        counts = growth_df['school'].value_counts().reindex(SCHOOL_ORDER, fill_value=0)
+    growth_avg = compute_growth_summary(growth_df)
+    kpis = compute_kpis(env_df, growth_df)
+    return {
+        "growth_avg": growth_avg,
+        "counts": counts,
+        "kpis": kpis,
+    }
+
+@st.cache_data
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """CSV 다운로드용 바이트 (엑셀 한글 깨짐 방지용 utf-8-sig, 결과는 캐시)"""
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+@st.cache_data
+def to_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    """엑셀 다운로드용 바이트 (쓰기 전용이므로 openpyxl보다 빠른 xlsxwriter 사용)"""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        df.to_excel(writer, index=False)
+    return buffer.getvalue()
+
+@st.cache_data
+def filter_by_school(school, *frames):
+    """
+    선택한 학교로 필터링한 데이터프레임들 (캐시).
+    키에 입력 데이터 내용이 포함되므로 데이터가 다시 로드되면 자동으로 새로 계산.
+    """
+    return tuple(df[df['school'] == school] if not df.empty else df for df in frames)
+
+# -----------------------------------------------------------------------------
+# 3. 차트 헬퍼
+# -----------------------------------------------------------------------------
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    LTTB(Largest-Triangle-Three-Buckets) 다운샘플링.
+    각 버킷에서 (이전 선택점, 다음 버킷 평균)과 가장 큰 삼각형을 이루는 점을 골라
+    그래프 모양을 유지하면서 포인트 수를 n_out 개로 줄임.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+@st.cache_data(show_spinner=False)
+def build_line(by_school, y, title) -> str:
+    """
+    시계열 라인 차트 (WebGL Scattergl), figure JSON으로 캐시.
+    load_data()에서 미리 나눠 둔 {학교: 시간순 데이터프레임}을 그대로 trace로 만듦.
+    x/y를 numpy 배열로 넘겨 Plotly가 base64 typed array로 직렬화하도록 함.
+    학교별로 LTTB 다운샘플링 후 최대 MAX_POINTS 개만 전송.
+    """
+    fig = go.Figure()
+    for school, g in by_school.items():
+        x = g['time'].to_numpy()
+        y_val = g[y].to_numpy(dtype='float32')
+        valid = ~np.isnat(x) & np.isfinite(y_val)
+        if not valid.any():  # 측정값이 하나도 없으면 trace 생성/다운샘플링 생략
+            continue
+        x, y_val = x[valid], y_val[valid]
+        keep = lttb_indices(x.astype('int64').astype('float64'), y_val.astype('float64'), MAX_POINTS)
+        fig.add_trace(go.Scattergl(x=x[keep], y=y_val[keep], mode='lines', name=school,
+                                   line_color=COLOR_MAP[school]))
+    fig.update_layout(title=title, xaxis_title='time', yaxis_title=y,
+                      legend_title_text='school', font=PLOTLY_FONT)
+    return fig.to_json()
+
+@st.cache_data(show_spinner=False)
+def build_weight_bar(summary, title) -> str:
+    """학교별 평균 생중량 막대그래프 (캐시된 생육 집계 사용), figure JSON으로 캐시"""
+    avg_weight = summary[['school', 'target_ec', '생중량(g)']]
+    fig = px.bar(avg_weight, x='school', y='생중량(g)', color='school',
+                 color_discrete_map=COLOR_MAP, hover_data=['target_ec'],
+                 title=title, text_auto='.2f')
+    fig.update_layout(font=PLOTLY_FONT)
+    return fig.to_json()
+
+def fit_ols_lines(df, x, y, n_points=50):
+    """
+    학교별 1차 회귀선 (np.polyfit, px trendline='ols'의 statsmodels 래퍼 대신 사용).
+    캐시는 호출하는 build_scatter에서 figure 단위로 처리.
+    반환: {학교: (xs, ys)}
+    """
+    lines = {}
+    for school, g in df.groupby('school', sort=False, observed=True):
+        xy = g[[x, y]].dropna()
+        xv, yv = xy[x].to_numpy(dtype='float64'), xy[y].to_numpy(dtype='float64')
+        if len(xv) < 2 or xv.min() == xv.max():
+            continue
+        b1, b0 = np.polyfit(xv, yv, 1)
+        xs = np.linspace(xv.min(), xv.max(), n_points)
+        lines[school] = (xs, b0 + b1 * xs)
+    return lines
+
+@st.cache_data(show_spinner=False)
+def build_scatter(df, x, y, title) -> str:
+    """산점도(WebGL) + 학교별 OLS 추세선, figure JSON으로 캐시. 학교가 하나뿐이면 color 그룹핑 생략"""
+    if df['school'].nunique() == 1:
+        school = df['school'].iat[0]
+        fig = px.scatter(df, x=x, y=y, title=title, render_mode='webgl',
+                         color_discrete_sequence=[COLOR_MAP[school]])
+    else:
+        fig = px.scatter(df, x=x, y=y, color='school', color_discrete_map=COLOR_MAP,
+                         title=title, render_mode='webgl')
+    for school, (xs, ys) in fit_ols_lines(df[['school', x, y]], x, y).items():
+        fig.add_trace(go.Scatter(x=xs, y=ys, mode='lines', name=f"{school} OLS",
+                                 line_color=COLOR_MAP[school], showlegend=False))
+    fig.update_layout(font=PLOTLY_FONT)
+    return fig.to_json()
+
+def show_chart(fig_json: str):
+    """
+    캐시된 figure JSON으로 차트 출력.
+    빌더마다 st.cache_data가 붙어 있어 같은 입력이면 LTTB/px 처리/회귀 적합을 통째로 건너뛰고,
+    빌더 코드를 고치면 캐시 키(함수 소스)도 바뀜.
+    """
+    st.plotly_chart(json.loads(fig_json), use_container_width=True)
+
+PREVIEW_ROWS = 500  # 원본 표에서 기본으로 보여줄 행 수
+
+def show_preview(df, key):
+    """
+    원본 데이터 표. 행이 많으면 앞부분만 브라우저로 보내고 행 수는 사용자가 조절.
+    (전체 데이터는 다운로드 버튼으로 제공)
+    """
+    if len(df) > PREVIEW_ROWS:
+        n = st.number_input("표시할 행 수", min_value=100, max_value=len(df),
+                            value=PREVIEW_ROWS, step=100, key=key)
+        st.caption(f"전체 {len(df):,}행 중 앞 {n:,}행 표시")
+        df = df.head(n)
+    st.dataframe(df)
 
 # -----------------------------------------------------------------------------
-# 3. 메인 로직
+# 4. 메인 로직
 # -----------------------------------------------------------------------------
 def main():
     st.title("🌱 극지식물 최적 EC 농도 연구 대시보드")
     
     with st.spinner("데이터 파일을 검색하고 불러오는 중..."):
-        env_df, growth_df = load_data()
+        env_df, growth_df, env_by_school = load_data()
 
     if (env_df is None or env_df.empty) and (growth_df is None or growth_df.empty):
         st.error("데이터를 불러오지 못했습니다. data 폴더 안의 파일명을 확인해주세요.")
         return
 
+    summaries = compute_summaries(env_df, growth_df)
+    growth_summary = summaries["growth_avg"]
+    kpis = summaries["kpis"]
+
     # 사이드바
     st.sidebar.header("🔍 필터 옵션")
-    school_list = ["전체"] + list(SCHOOL_CONFIG.keys())
-    selected_school = st.sidebar.selectbox("학교 선택", school_list)
+    selected_school = st.sidebar.selectbox("학교 선택", SCHOOL_OPTIONS)
 
     if selected_school != "전체":
-        env_filtered = env_df[env_df['school'] == selected_school] if not env_df.empty else pd.DataFrame()
-        growth_filtered = growth_df[growth_df['school'] == selected_school] if not growth_df.empty else pd.DataFrame()
+        # 환경 데이터는 load_data()에서 나눠 둔 학교별 조각을 그대로 사용 (마스크/복사 없음)
+        env_filtered = env_by_school.get(selected_school, pd.DataFrame())
+        env_series = {selected_school: env_filtered} if not env_filtered.empty else {}
+        growth_filtered, growth_summary = filter_by_school(
+            selected_school, growth_df, growth_summary)
     else:
         env_filtered = env_df
         growth_filtered = growth_df
+        env_series = env_by_school
 
     tab1, tab2, tab3 = st.tabs(["📖 실험 개요", "🌡️ 환경 데이터", "📊 생육 결과"])
 
@@ -171,37 +529,33 @@ def main():
         col1, col2 = st.columns([1, 2])
         with col1:
             st.subheader("실험 조건")
-            summary = [{"학교": k, "목표 EC": v['ec']} for k, v in SCHOOL_CONFIG.items()]
-            st.dataframe(pd.DataFrame(summary), hide_index=True, use_container_width=True)
+            table = SUMMARY_BASE
+            if not growth_df.empty:
+                table = SUMMARY_BASE.assign(개체수=summaries["counts"].astype(str).add('개').to_numpy())
+            st.dataframe(table, hide_index=True, use_container_width=True)
         with col2:
             st.subheader("데이터 현황")
             if not growth_df.empty:
-                cnt = len(growth_df)
-                st.metric("총 생육 데이터 개수", f"{cnt}개")
+                st.metric("총 생육 데이터 개수", f"{kpis['growth_count']}개")
             if not env_df.empty:
-                last_update = env_df['time'].max()
-                st.metric("환경 데이터 마지막 측정", str(last_update))
+                st.metric("환경 데이터 마지막 측정", str(kpis['last_update']))
 
     # Tab 2: 환경 데이터
     with tab2:
-        if not env_filtered.empty:
+        if not env_filtered.empty and env_series:
             st.subheader("환경 데이터 시계열 분석")
             
             # 그래프 2개 배치 (온도, EC)
             c1, c2 = st.columns(2)
             with c1:
-                fig_t = px.line(env_filtered, x='time', y='temperature', color='school', title="온도 변화")
-                fig_t.update_layout(font=PLOTLY_FONT)
-                st.plotly_chart(fig_t, use_container_width=True)
+                show_chart(build_line(env_series, 'temperature', "온도 변화"))
             with c2:
-                fig_e = px.line(env_filtered, x='time', y='ec', color='school', title="EC 변화")
-                fig_e.update_layout(font=PLOTLY_FONT)
-                st.plotly_chart(fig_e, use_container_width=True)
+                show_chart(build_line(env_series, 'ec', "EC 변화"))
 
             with st.expander("환경 데이터 원본"):
-                st.dataframe(env_filtered)
+                show_preview(env_filtered, key=f"env_rows_{selected_school}")
                 # CSV 다운로드
-                csv_buffer = env_filtered.to_csv(index=False).encode('utf-8-sig')
+                csv_buffer = to_csv_bytes(env_filtered)
                 st.download_button("CSV 다운로드", csv_buffer, "env_data.csv", "text/csv")
         else:
             st.info("표시할 환경 데이터가 없습니다.")
@@ -211,31 +565,21 @@ def main():
         if not growth_filtered.empty:
             st.subheader("EC별 생육 비교")
             
-            # KPI 계산: 생중량 비교
-            avg_weight = growth_filtered.groupby('school')['생중량(g)'].mean().reset_index()
-            avg_weight['color'] = avg_weight['school'].map(lambda x: SCHOOL_CONFIG[x]['color'])
-            
-            fig_bar = px.bar(avg_weight, x='school', y='생중량(g)', color='school', 
-                             title="학교별 평균 생중량", text_auto='.2f')
-            fig_bar.update_layout(font=PLOTLY_FONT)
-            st.plotly_chart(fig_bar, use_container_width=True)
+            # KPI 계산: 생중량 비교 (캐시된 집계 결과 사용)
+            show_chart(build_weight_bar(growth_summary, "학교별 평균 생중량"))
             
             # 상관관계
             st.subheader("상관관계 분석")
-            fig_scat = px.scatter(growth_filtered, x='잎 수(장)', y='생중량(g)', color='school',
-                                  title="잎 수 vs 생중량", trendline='ols')
-            fig_scat.update_layout(font=PLOTLY_FONT)
-            st.plotly_chart(fig_scat, use_container_width=True)
+            show_chart(build_scatter(growth_filtered, '잎 수(장)', '생중량(g)', "잎 수 vs 생중량"))
 
             with st.expander("생육 데이터 원본"):
-                st.dataframe(growth_filtered)
-                # Excel 다운로드
-                buffer = io.BytesIO()
-                with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                    growth_filtered.to_excel(writer, index=False)
-                buffer.seek(0)
-                st.download_button("Excel 다운로드", buffer, "growth_data.xlsx", 
-                                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                show_preview(growth_filtered, key=f"growth_rows_{selected_school}")
+                # Excel 다운로드 (요청했을 때만 생성, 결과는 캐시)
+                if st.button("Excel 파일 준비"):
+                    st.session_state["xlsx_requested"] = True
+                if st.session_state.get("xlsx_requested"):
+                    st.download_button("Excel 다운로드", to_xlsx_bytes(growth_filtered), "growth_data.xlsx", 
+                                       "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
         else:
             st.info("표시할 생육 데이터가 없습니다.")
 